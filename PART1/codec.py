@@ -0,0 +1,254 @@
+"""
+codec
+---------------------------------------------------------------------
+Encoder/decoder for Ethernet frames carrying an 802.1D configuration
+BPDU, shared by 'bpdu' and anything that analyzes captures.
+
+A frame is laid out as:
+    Ethernet  dst(6) src(6) length(2)         802.3, length = 38
+    LLC       dsap ssap control (42 42 03)
+    BPDU      proto(2) version type flags root_pri(2) root_mac(6)
+              root_cost(4) bridge_pri(2) bridge_mac(6) port_id(2)
+              msg_age(2) max_age(2) hello_time(2) fwd_delay(2)
+and padded to the 60-byte Ethernet minimum. All fields are big-endian,
+the times are in 1/256 seconds.
+
+decode()/encode() handle one frame with precompiled structs.
+frames()/decode_file() stream the frames of a file, either a pcap
+capture or a '.bin' file of frames back to back (split using the 802.3
+length field). decode_array() decodes a whole capture in memory into a
+NumPy structured array in one vectorized step; it is only available if
+NumPy is installed. 'python codec.py FILE...' checks that both decoders
+agree on the frames of each file.
+---------------------------------------------------------------------
+"""
+import struct
+import collections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FRAME = struct.Struct('!6s6sH3sHBBBH6sIH6sHHHHH')
+FRAME_MIN = 60                  # frames are padded to this size
+LLC_STP = b'\x42\x42\x03'
+BPDU_LEN = FRAME.size - 14      # 802.3 length of LLC + config BPDU
+ETH_HDR = struct.Struct('!6s6sH')
+ETH_TYPE_MIN = 0x600            # length fields are below, ethertypes above
+
+FIELDS = ('ether_dst', 'ether_src', 'length', 'llc', 'proto', 'version',
+          'type', 'flags', 'root_pri', 'root_mac', 'root_cost', 'bridge_pri',
+          'bridge_mac', 'port_id', 'msg_age', 'max_age', 'hello_time',
+          'fwd_delay')
+
+"""
+Bpdu: one decoded frame, a namedtuple of FIELDS. MACs are 6-byte
+strings, everything else is an int.
+"""
+Bpdu = collections.namedtuple('Bpdu', FIELDS)
+
+"""
+function: make(ether_src, root_mac, bridge_mac, ...)
+Description: a Bpdu with the defaults 'bridge' sends: to the spanning
+tree multicast address, 20s max age, 2s hello time, 15s forward delay
+"""
+def make(ether_src, root_mac, bridge_mac, root_cost=0, port_id=0, msg_age=0,
+         root_pri=0x8000, bridge_pri=0x8000, flags=0, type=0,
+         ether_dst=b'\x01\x80\xc2\x00\x00\x00', max_age=20*256,
+         hello_time=2*256, fwd_delay=15*256):
+    return Bpdu(ether_dst, ether_src, BPDU_LEN, LLC_STP, 0, 0, type, flags,
+                root_pri, root_mac, root_cost, bridge_pri, bridge_mac,
+                port_id, msg_age, max_age, hello_time, fwd_delay)
+
+"""
+function: decode(buf, offset=0)
+Description: decode the frame at 'offset' of 'buf' (a string, buffer,
+bytearray or mmap). Raises ValueError if it is not a configuration BPDU.
+"""
+def decode(buf, offset=0):
+    if len(buf) - offset < FRAME.size:
+        raise ValueError('frame too short for a BPDU')
+    b = Bpdu._make(FRAME.unpack_from(buf, offset))
+    if b.llc != LLC_STP or b.length >= ETH_TYPE_MIN:
+        raise ValueError('not a spanning tree frame')
+    return b
+
+"""
+function: encode(bpdu)
+Description: the frame for 'bpdu', padded to FRAME_MIN bytes
+"""
+def encode(bpdu):
+    return FRAME.pack(*bpdu) + b'\0' * (FRAME_MIN - FRAME.size)
+
+"""
+function: frames(f)
+Description: yield every frame in file 'f' as (timestamp, frame). Pcap
+files are recognized by their magic number and give the capture time;
+for '.bin' files the timestamp is None, and anything left at the end
+that is shorter than an Ethernet header is ignored (like a newline).
+"""
+def frames(f):
+    head = f.read(24)
+    pcap = _pcap_header(head)
+    if pcap is not None:
+        endian, scale = pcap
+        rec = struct.Struct(endian + 'IIII')
+        while True:
+            h = f.read(rec.size)
+            if len(h) < rec.size:
+                return
+            sec, frac, caplen, origlen = rec.unpack(h)
+            frame = f.read(caplen)
+            if len(frame) < caplen:
+                return
+            yield sec + frac * scale, frame
+    else:
+        buf = head
+        while True:
+            more = f.read(65536)
+            buf += more
+            offset = 0
+            while len(buf) - offset >= ETH_HDR.size:
+                n = _bin_length(buf, offset)
+                if len(buf) - offset < n and more:
+                    break                       # the rest is in the next chunk
+                yield None, buf[offset:offset+n]
+                offset += n
+            buf = buf[offset:]
+            if not more:
+                return
+
+"""
+function: decode_file(f)
+Description: yield a Bpdu for every spanning tree frame in file 'f';
+other frames are skipped
+"""
+def decode_file(f):
+    for t, frame in frames(f):
+        try:
+            yield decode(frame)
+        except ValueError:
+            pass
+
+# (struct byte order, seconds per timestamp fraction) for a pcap global
+# header, None if it is not one
+def _pcap_header(head):
+    if len(head) < 24:
+        return None
+    for endian in '<>':
+        magic, = struct.unpack(endian + 'I', head[:4])
+        if magic == 0xa1b2c3d4:
+            return endian, 1e-6
+        if magic == 0xa1b23c4d:
+            return endian, 1e-9
+    return None
+
+# length of the frame at 'offset' of a '.bin' file: 802.3 frames by their
+# length field, padded to FRAME_MIN; anything else is taken to be FRAME_MIN
+def _bin_length(buf, offset):
+    length, = struct.unpack_from('!H', buf, offset + 12)
+    if length >= ETH_TYPE_MIN:
+        return FRAME_MIN
+    return max(ETH_HDR.size + length, FRAME_MIN)
+
+#---------------------------------------------------------------------
+# NumPy
+
+if numpy is not None:
+    _mac = (numpy.uint8, (6,))
+    BPDU_DTYPE = numpy.dtype([
+        ('ether_dst', _mac), ('ether_src', _mac), ('length', '>u2'),
+        ('llc', (numpy.uint8, (3,))), ('proto', '>u2'), ('version', 'u1'),
+        ('type', 'u1'), ('flags', 'u1'), ('root_pri', '>u2'),
+        ('root_mac', _mac), ('root_cost', '>u4'), ('bridge_pri', '>u2'),
+        ('bridge_mac', _mac), ('port_id', '>u2'), ('msg_age', '>u2'),
+        ('max_age', '>u2'), ('hello_time', '>u2'), ('fwd_delay', '>u2')])
+    assert BPDU_DTYPE.itemsize == FRAME.size
+
+"""
+function: decode_array(data)
+Description: decode every spanning tree frame of a capture held in
+'data' (the contents of a pcap or '.bin' file) into a NumPy array of
+BPDU_DTYPE. The frame offsets are found first - all at once when every
+record has the same size, as in a capture or '.bin' file of nothing but
+BPDUs - and the frames are then gathered and filtered in single array
+operations.
+"""
+def decode_array(data):
+    if numpy is None:
+        raise ImportError('decode_array needs NumPy')
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    offsets = _offsets(data)
+    offsets = offsets[offsets + FRAME.size <= len(raw)]
+    rows = raw[offsets[:, None] + numpy.arange(FRAME.size)]
+    a = numpy.ascontiguousarray(rows).view(BPDU_DTYPE).ravel()
+    stp = (a['llc'] == numpy.frombuffer(LLC_STP, numpy.uint8)).all(axis=1) & \
+        (a['length'] < ETH_TYPE_MIN)
+    return a[stp]
+
+# numpy array of the offsets of all frames in 'data'
+def _offsets(data):
+    pcap = _pcap_header(data[:24])
+    if pcap is None:
+        # when every frame is FRAME_MIN bytes, they are FRAME_MIN apart
+        n = (len(data) - ETH_HDR.size) // FRAME_MIN + 1 if len(data) >= ETH_HDR.size else 0
+        if n:
+            lengths = numpy.ndarray((n,), dtype='>u2', buffer=data,
+                                    offset=12, strides=(FRAME_MIN,))
+            if ((lengths >= ETH_TYPE_MIN) | (lengths <= FRAME_MIN - ETH_HDR.size)).all():
+                return FRAME_MIN * numpy.arange(n, dtype=numpy.intp)
+
+        offsets, offset = [], 0
+        while len(data) - offset >= ETH_HDR.size:
+            offsets.append(offset)
+            offset += _bin_length(data, offset)
+        return numpy.array(offsets, dtype=numpy.intp)
+
+    endian = pcap[0]
+    rec = struct.Struct(endian + 'IIII')
+    if len(data) < 24 + rec.size:
+        return numpy.zeros(0, dtype=numpy.intp)
+    caplen = rec.unpack_from(data, 24)[2]
+    if caplen >= FRAME.size:
+        size = rec.size + caplen
+        n = (len(data) - 24) // size
+        caplens = numpy.ndarray((n,), dtype=endian + 'u4', buffer=data,
+                                offset=24 + 8, strides=(size,))
+        if (caplens == caplen).all():
+            return 24 + rec.size + size * numpy.arange(n, dtype=numpy.intp)
+
+    offsets, offset = [], 24
+    while len(data) - offset >= rec.size:
+        caplen = rec.unpack_from(data, offset)[2]
+        if caplen >= FRAME.size:
+            offsets.append(offset + rec.size)
+        offset += rec.size + caplen
+    return numpy.array(offsets, dtype=numpy.intp)
+
+"""
+function: check(data)
+Description: decode 'data' with both decode_array() and decode_file(),
+raise ValueError if the results differ. Run as 'python codec.py FILE...'
+to check the NumPy decoder against the struct one on real captures.
+"""
+def check(data):
+    import io
+    expected = list(decode_file(io.BytesIO(data)))
+    a = decode_array(data)
+    if len(a) != len(expected):
+        raise ValueError('%d frames from decode_array, %d from decode_file'
+                         % (len(a), len(expected)))
+    for n, (row, b) in enumerate(zip(a, expected)):
+        for name in FIELDS:
+            x = row[name]
+            x = x.tobytes() if x.shape else int(x)
+            if x != getattr(b, name):
+                raise ValueError('frame %d: %s differs' % (n, name))
+    return len(a)
+
+if __name__ == '__main__':
+    import sys
+    for name in sys.argv[1:]:
+        with open(name, 'rb') as f:
+            print('%s: %d frames match' % (name, check(f.read())))
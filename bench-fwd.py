@@ -0,0 +1,318 @@
+#!/usr/bin/python
+#
+# bench-fwd.py - forwarding throughput and latency benchmark for 'bridge'
+#
+# Starts 'wires' and a single bridge, connects one endpoint to each of its
+# ports the way test-lb.py does, and sends unicast frames through it. Every
+# frame carries a run number, a sequence number and its send time, so the
+# receiving side can count what got through and how long it took.
+#
+# The benchmark sweeps frame sizes, MAC counts and port counts (and optionally
+# send rates; 0 is as fast as possible). The MACs are spread over the ports
+# round robin, and each frame goes from one MAC to the next one on another
+# port, so with enough MACs every port sends to every other one. Before each
+# run every MAC sends a broadcast, so that the bridge has learned them all and
+# nothing is flooded.
+# The bridge is restarted for every port count, which means waiting for its
+# ports to go through listening and learning (2 * FWD_DELAY) each time.
+#
+# For each run it prints, and with --json writes, the offered and forwarded
+# rates in frames/sec, the loss, and latency percentiles in microseconds.
+# Latency includes the time 'wires' and this script take, so compare runs made
+# on the same machine only.
+#
+
+import random, threading, subprocess
+import select, time, json
+import struct, socket
+import signal, sys, getpass
+import argparse
+import ring
+from stats import percentile
+
+#------------------------------------
+
+# infrastructure, as in test-lb.py. 'wires' and 'bridge' run in separate
+# processes, and this process connects sockets to 'wires' and transmits/receives
+# packets
+
+listeners = []
+
+# connect to a wire and return a socket (a ring endpoint with '--ring')
+def connect(wirenum, local):
+    name = '\0%s.host-%s)' % (getpass.getuser(), local)
+    if args.ring:
+        s = ring.connect(wirenum, name)
+        if s is None:
+            print 'connection error'
+            sys.exit(1)
+        return s
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    s.bind(name)
+    if s.connect_ex('\0%s.wire.%d' % (getpass.getuser(), wirenum)):
+        print 'connection error'
+        sys.exit(1)
+    return s
+
+# socket listener - hands received datagrams to 'responder'
+class listener:
+    def __init__(self, sock, port, responder):
+        self.sock,self.port,self.responder = sock,port,responder
+        listeners.append(self)
+        self.error = None
+    def done(self):
+        if self in listeners:
+            listeners.remove(self)
+
+def find_listener(sock):
+    for l in listeners:
+        if l.sock == sock:
+            return l
+    return None
+
+def deliver(l, dgram):
+    if not dgram:
+        l.error = 'Receive failed'
+        l.done()
+    else:
+        l.responder(l, dgram)
+
+# listen on all sockets. Ring endpoints are drained before going to sleep, and
+# their sockets only wake us up
+def _listen_thread():
+    while True:
+        timeout = 0.1
+        for l in listeners:
+            if isinstance(l.sock, ring.RingEndpoint):
+                timeout = ring.RING_POLL if l.sock.idle() else 0
+                if timeout == 0:
+                    break
+        rfds,ign1,ign2 = select.select([x.sock for x in listeners], [], [], timeout)
+        for s in rfds:
+            l = find_listener(s)
+            if l is None:
+                continue
+            if isinstance(s, ring.RingEndpoint):
+                if not s.wake():
+                    deliver(l, '')
+            else:
+                deliver(l, s.recv(1500))
+        for l in listeners[:]:
+            if isinstance(l.sock, ring.RingEndpoint):
+                l.sock.busy()
+                while l in listeners and l.sock.pending():
+                    deliver(l, l.sock.get())
+
+def listen_thread():
+    try:
+        _listen_thread()
+    except:
+        pass
+
+# generate some non-multicast MAC addresses
+def getaddrs(n):
+    return ['\0\0' + struct.pack('!I', i + 1) for i in range(n)]
+
+#------------------------------------
+# the frames
+
+ETHERTYPE = 0x88b5                      # IEEE local experimental
+PROBE = struct.Struct('!6s6sH')
+HDR = struct.Struct('!6s6sHHId')        # dst, src, type, run, seq, send time
+BCAST = '\xff' * 6
+
+# what one run received
+class Run(object):
+    def __init__(self, number, count):
+        self.number = number
+        self.seen = bytearray(count)
+        self.received = 0
+        self.dups = 0
+        self.latency = []
+        self.last_rx = None
+
+run = Run(0, 0)
+probes = set()          # ports a probe frame arrived on
+
+def receive(l, pkt):
+    now = time.time()
+    if len(pkt) < HDR.size or pkt[12:14] != '\x88\xb5':
+        return                                  # spanning tree, mostly
+    dst, src, t, number, seq, sent = HDR.unpack_from(pkt)
+    r = run
+    if number == 0:
+        probes.add(l.port)
+    elif number == r.number and seq < len(r.seen):
+        if r.seen[seq]:
+            r.dups += 1
+        else:
+            r.seen[seq] = 1
+            r.received += 1
+            r.latency.append(now - sent)
+        r.last_rx = now
+
+# wait until the bridge forwards between port 0 and every other one
+def wait_forwarding(socks, timeout):
+    deadline = time.time() + timeout
+    probe = PROBE.pack(BCAST, '\0\0\xff\xff\xff\xff', ETHERTYPE) + \
+        struct.pack('!HId', 0, 0, 0) + '\0' * 32
+    probes.clear()
+    while time.time() < deadline:
+        send(socks[0], probe)
+        time.sleep(0.5)
+        if len(probes) == len(socks) - 1:
+            return True
+    return False
+
+# send, retrying while a ring is full
+def send(s, pkt):
+    while not s.send(pkt):
+        time.sleep(0)
+
+#------------------------------------
+# one run: 'count' frames of 'size' bytes between 'nmacs' MACs at 'rate'
+# frames/sec (0: as fast as possible)
+
+def do_run(number, socks, size, nmacs, rate, count):
+    global run
+    nports = len(socks)
+    macs = getaddrs(nmacs)
+    port = [m % nports for m in range(nmacs)]
+
+    # let the bridge learn every MAC
+    for m in range(nmacs):
+        send(socks[port[m]], PROBE.pack(BCAST, macs[m], 0x900) + '\0' * 46)
+    time.sleep(0.5 + nmacs / 5000.0)
+
+    frames = []
+    for m in range(nmacs):
+        dst = (m + 1) % nmacs
+        while port[dst] == port[m]:
+            dst = (dst + 1) % nmacs
+        buf = bytearray(size)
+        HDR.pack_into(buf, 0, macs[dst], macs[m], ETHERTYPE, number, 0, 0)
+        frames.append(buf)
+    pad = ''.join(chr(random.randint(0, 255)) for i in range(size - HDR.size))
+    for buf in frames:
+        buf[HDR.size:] = pad
+
+    run = Run(number, count)
+    offsets = struct.Struct('!Id')
+    at = PROBE.size + 2
+    t0 = time.time()
+    for seq in range(count):
+        if rate:
+            delay = t0 + seq / float(rate) - time.time()
+            if delay > 0.001:
+                time.sleep(delay)
+        m = seq % nmacs
+        buf = frames[m]
+        offsets.pack_into(buf, at, seq, time.time())
+        send(socks[port[m]], buf)
+    t1 = time.time()
+
+    # wait for stragglers: until nothing arrived for half a second
+    while True:
+        time.sleep(0.5)
+        last = run.last_rx
+        if last is None or time.time() - last >= 0.5 or run.received == count:
+            break
+
+    r = run
+    latency = sorted(r.latency)
+    result = {'size': size, 'macs': nmacs, 'ports': nports, 'rate': rate,
+              'sent': count, 'received': r.received, 'dups': r.dups,
+              'loss': 1 - r.received / float(count),
+              'offered_pps': count / max(t1 - t0, 1e-6),
+              'pps': r.received / max((r.last_rx or t1) - t0, 1e-6)}
+    for name, p in (('p50', 50), ('p99', 99), ('p999', 99.9)):
+        result[name + '_us'] = percentile(latency, p) * 1e6 if latency else None
+    return result
+
+def print_result(r):
+    us = lambda x: '-' if x is None else '%.0f' % x
+    print '%5d %6d %5d %7s %8.0f %8.0f %6.2f%% %8s %8s %8s' % (
+        r['size'], r['macs'], r['ports'], r['rate'] or 'max', r['offered_pps'], r['pps'],
+        r['loss'] * 100, us(r['p50_us']), us(r['p99_us']), us(r['p999_us']))
+    sys.stdout.flush()
+
+def int_list(s):
+    return [int(x) for x in s.split(',')]
+
+#------------------------------------
+# now set everything up
+
+parser = argparse.ArgumentParser(description='Bench-fwd - bridge forwarding benchmark')
+parser.add_argument('--sizes', type=int_list, default=[64, 512, 1500],
+                    help='frame sizes (default 64,512,1500)')
+parser.add_argument('--macs', type=int_list, default=[2, 256, 4096],
+                    help='MAC address counts (default 2,256,4096)')
+parser.add_argument('--ports', type=int_list, default=[2, 4],
+                    help='bridge port counts (default 2,4)')
+parser.add_argument('--rates', type=int_list, default=[0],
+                    help='send rates in frames/sec, 0 for unlimited (default 0)')
+parser.add_argument('-n', '--count', type=int, default=20000,
+                    help='frames per run (default 20000)')
+parser.add_argument('--json', metavar='FILE', help='write the results to FILE')
+parser.add_argument('--ring', action='store_true', help='connect through shared-memory rings')
+parser.add_argument('--verbose', action='store_true', help='verbose printing')
+parser.add_argument('extra', nargs='*', help='[-- arg [arg...]] argument to bridge executable')
+args = parser.parse_args()
+
+if min(args.sizes) < HDR.size or max(args.sizes) > 1500:
+    parser.error('frame sizes must be %d..1500' % HDR.size)
+if min(args.ports) < 2:
+    parser.error('need at least 2 ports')
+
+b_id = '01:01:01:01:01:01'
+devnull = open('/dev/null', 'w')
+out = sys.stdout if args.verbose else devnull
+w = subprocess.Popen(['./wires', '--quiet', str(max(args.ports))], stdout=out)
+time.sleep(1.0)
+
+t = threading.Thread(target=listen_thread, args=())
+t.daemon = True
+t.start()
+
+results = []
+number = 0
+bridge = None
+try:
+    print ' size   macs ports    rate  offered   fwd/s    loss      p50      p99     p999 (us)'
+    for nports in args.ports:
+        b_args = ['--ring'] if args.ring else []
+        bridge = subprocess.Popen(['./bridge'] + b_args + args.extra +
+                                  [b_id] + [str(i) for i in range(nports)],
+                                  stdout=out, stderr=sys.stderr)
+        socks = [connect(i, 'benchhost-%d' % i) for i in range(nports)]
+        ls = [listener(s, i, receive) for i, s in enumerate(socks)]
+        if not wait_forwarding(socks, 45):
+            print 'bridge with %d ports does not forward' % nports
+            sys.exit(1)
+        for size in args.sizes:
+            for nmacs in args.macs:
+                for rate in args.rates:
+                    number += 1
+                    r = do_run(number, socks, size, max(nmacs, nports), rate, args.count)
+                    results.append(r)
+                    print_result(r)
+        for l in ls:
+            l.done()
+        time.sleep(0.2)
+        for s in socks:
+            s.close()
+        bridge.send_signal(signal.SIGTERM)
+        bridge.wait()
+        bridge = None
+except KeyboardInterrupt:   #so ^C works
+    pass
+finally:
+    if bridge:
+        bridge.send_signal(signal.SIGTERM)
+    w.send_signal(signal.SIGTERM)
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump({'bridge': args.extra, 'ring': args.ring, 'count': args.count,
+                   'runs': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+#
+# bench-parse.py - microbenchmark for the bridge frame decoder
+#
+# Decodes the same set of BPDU frames with the old hexlify/string-splitting
+# decoder and with the struct-based Frame view from 'bridge', and reports
+# frames/sec for each.
+#
+
+import imp, time, struct, string, argparse, random
+
+parser = argparse.ArgumentParser(description='Bench-parse - frame decoder microbenchmark')
+parser.add_argument('-n', type=int, default=200000, help='frames per run (default 200000)')
+parser.add_argument('--runs', type=int, default=3, help='runs, best is reported (default 3)')
+args = parser.parse_args()
+
+bridge = imp.load_source('bridge', './bridge')
+
+def ether_ntoa(n):
+    return string.join(map(lambda x: "%02x" % x, struct.unpack('6B', n)), ':')
+
+def htod(n):
+    return int("0x" + str(n),0)
+
+# the decoder as it was before the struct-based parser, minus the printing
+def old_decode(dgram):
+    dst, src, root_mac = struct.unpack('6s 6s 6s', dgram[0:18])
+    result = string.join(map\
+        (lambda x: '%02x' % ord(x), buffer(dgram)[:]), ' ').split()
+    return (ether_ntoa(dst), ether_ntoa(root_mac), htod(string.join(result[18:20],'')),
+            htod(string.join(result[20:22],'')), ether_ntoa(src),
+            htod(string.join(result[22:24],'')))
+
+# the fields new_package() reads, straight from the buffer
+def new_decode(dgram):
+    f = bridge.Frame(memoryview(dgram))
+    return (f.dst, f.root_mac, f.port_id, f.root_cost, f.src, f.msg_age)
+
+def make_frames(n):
+    frames = []
+    for i in range(n):
+        mac = ''.join([chr(random.randint(0, 255)) for j in range(6)])
+        frames.append(bridge.BPDU_FRAME.pack(bridge.STP_DST, mac, bridge.BPDU_LEN,
+                                             bridge.LLC_STP, 0, 0, 0, 0,
+                                             bridge.PRIORITY, mac, 10*i, bridge.PRIORITY,
+                                             mac, i, 256, 20*256, 2*256, 15*256))
+    return frames
+
+def bench(decode, frames, n, runs):
+    best = None
+    for r in range(runs):
+        t0 = time.time()
+        for i in xrange(n):
+            decode(frames[i & 255])
+        dt = time.time() - t0
+        best = dt if best is None else min(best, dt)
+    return n / best
+
+frames = make_frames(256)
+before = bench(old_decode, frames, args.n, args.runs)
+after = bench(new_decode, frames, args.n, args.runs)
+print 'before: %10.0f frames/sec' % before
+print 'after:  %10.0f frames/sec' % after
+print 'speedup: %.1fx' % (after / before)
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+#
+# bench-stp.py - spanning tree convergence benchmark
+#
+# Reads a topology file (see topology.py), starts 'wires' and a 'bridge'
+# process for every bridge and a 'host' for every host in it, and measures how
+# long the spanning tree takes to converge: until every bridge has chosen the
+# lowest bridge ID it can reach as its root, and no bridge has changed its root
+# or the set of ports it blocks for --settle seconds. The bridges print an
+# 'STP root ...' line whenever that changes; the time of the last change,
+# counted from the start of the phase, is the convergence time.
+#
+# A bridge only notices that a wire failed when the BPDU it last received on it
+# ages out, which takes longer than --settle. So after a failure the bridges are
+# also not converged while any of them still has its root port, or a blocked
+# port, on the failed wire: without BPDUs those end up 'Designated'.
+#
+# After the initial convergence it runs --trials rounds of failing a random
+# wire between bridges through wire.ctl and fixing it again, and measures
+# reconvergence after each. A wire whose loss changes nothing converges in 0s.
+#
+# The report gives percentiles for each kind of phase; --json writes them to a
+# file as well, for comparison between releases.
+#
+
+import os, sys, time, json, errno, random, select, socket
+import getpass, argparse, subprocess
+
+import topology
+from stats import percentile
+
+parser = argparse.ArgumentParser(description='Bench-stp - spanning tree convergence benchmark')
+parser.add_argument('topology', metavar='FILE', help='topology file')
+parser.add_argument('--trials', type=int, default=5, help='fail/fix rounds (default 5)')
+parser.add_argument('--settle', type=float, default=5.0,
+                    help='seconds without changes to call it converged (default 5)')
+parser.add_argument('--timeout', type=float, default=120.0,
+                    help='longest a phase may take, in seconds (default 120)')
+parser.add_argument('--seed', type=int, help='random seed for the wires to fail')
+parser.add_argument('--ring', action='store_true', help='run bridges and hosts with --ring')
+parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+parser.add_argument('--verbose', action='store_true', help='print every topology change')
+args = parser.parse_args()
+
+#------------------------------------
+# processes
+
+procs = []
+
+def start(argv, stdout):
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    p = subprocess.Popen(argv, stdout=stdout, stderr=sys.stderr, env=env)
+    procs.append(p)
+    return p
+
+def stop_all():
+    for p in reversed(procs):
+        if p.poll() is None:
+            p.terminate()
+    for p in procs:
+        p.wait()
+
+# wait until 'wires' is listening; it binds wire.ctl after all the wires
+def wait_for_wires(timeout=5.0):
+    deadline = time.time() + timeout
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    while s.connect_ex('\0%s.wire.ctl' % getpass.getuser()):
+        if time.time() > deadline:
+            sys.exit('wires did not start')
+        time.sleep(0.05)
+    s.close()
+
+def send_ctl(msg):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    s.sendto(msg, '\0%s.wire.ctl' % getpass.getuser())
+    s.close()
+
+#------------------------------------
+# what the bridges print
+
+# a running bridge: the last 'STP root' line it printed, as (root, cost,
+# root port or None, tuple of blocked ports)
+class BridgeProc(object):
+    def __init__(self, mac, ports):
+        self.mac, self.ports = mac, ports
+        extra = ['--ring'] if args.ring else []
+        self.proc = start(['./bridge'] + extra + [mac] + map(str, ports), subprocess.PIPE)
+        self.fd = self.proc.stdout.fileno()
+        self.partial = ''
+        self.state = None
+
+    # read what is available, return True if the state changed
+    def read(self):
+        data = os.read(self.fd, 65536)
+        if not data:
+            sys.exit('bridge %s exited' % self.mac)
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        old = self.state
+        for line in lines:
+            if line.startswith('STP root '):
+                w = line.split()
+                port = None if w[6] == '-' else int(w[6])
+                blocked = () if w[8] == '-' else tuple(map(int, w[8].split(',')))
+                self.state = (w[2], int(w[4]), port, blocked)
+        return self.state != old
+
+    # converged, given the root it should have and the failed wires
+    def settled(self, root, failed):
+        if self.state is None or self.state[0] != root:
+            return False
+        return self.state[2] not in failed and not failed.intersection(self.state[3])
+
+# the root each bridge should end up with: the lowest ID among the bridges it
+# can reach over wires that have not failed
+def expected_roots(bridges, failed):
+    parent = dict((b.mac, b.mac) for b in bridges)
+    def find(m):
+        while parent[m] != m:
+            parent[m] = parent[parent[m]]
+            m = parent[m]
+        return m
+    on_wire = dict()
+    for b in bridges:
+        for w in b.ports:
+            if w in failed:
+                continue
+            if w in on_wire:
+                r1, r2 = find(b.mac), find(on_wire[w])
+                parent[max(r1, r2)] = min(r1, r2)   # canonical MACs sort as IDs
+            else:
+                on_wire[w] = b.mac
+    return dict((b.mac, find(b.mac)) for b in bridges)
+
+# wait for the bridges to converge after something changed at time t0.
+# Returns the time from t0 to the last change, or None on timeout.
+def converge(bridges, failed, t0):
+    expected = expected_roots(bridges, failed)
+    by_fd = dict((b.fd, b) for b in bridges)
+    last = t0
+    while True:
+        now = time.time()
+        if now - last >= args.settle and \
+                all(b.settled(expected[b.mac], failed) for b in bridges):
+            return max(last - t0, 0.0)
+        if now - t0 > args.timeout:
+            return None
+        try:
+            rfds, w, x = select.select(by_fd.keys(), [], [], 0.2)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            continue
+        for fd in rfds:
+            b = by_fd[fd]
+            if b.read():
+                last = time.time()
+                if args.verbose:
+                    root, cost, port, blocked = b.state
+                    print '  %6.2fs %s: root %s cost %d port %s blocked %s' % \
+                        (last - t0, b.mac, root, cost, '-' if port is None else port,
+                         ','.join(map(str, blocked)) or '-')
+
+#------------------------------------
+# report
+
+def summary(samples):
+    done = sorted(x for x in samples if x is not None)
+    result = {'samples': samples, 'timeouts': len(samples) - len(done)}
+    if done:
+        for p in (50, 90, 99):
+            result['p%d' % p] = percentile(done, p)
+        result['max'] = done[-1]
+        result['mean'] = sum(done) / len(done)
+    return result
+
+def print_summary(name, s):
+    line = '%-8s n=%-3d' % (name, len(s['samples']))
+    if 'p50' in s:
+        line += ' p50 %6.2fs  p90 %6.2fs  p99 %6.2fs  max %6.2fs  mean %6.2fs' % \
+            (s['p50'], s['p90'], s['p99'], s['max'], s['mean'])
+    if s['timeouts']:
+        line += '  (%d timed out)' % s['timeouts']
+    print line
+
+#------------------------------------
+
+if __name__ == '__main__':
+    try:
+        with open(args.topology) as f:
+            bridge_list, host_list = topology.read(f)
+    except (IOError, ValueError) as e:
+        sys.exit('%s: %s' % (args.topology, e))
+    if not bridge_list:
+        sys.exit('%s: no bridges' % args.topology)
+
+    # the wires that have bridges on both ends - failing the others would
+    # only cut off hosts
+    count = dict()
+    for mac, ports in bridge_list:
+        for w in ports:
+            count[w] = count.get(w, 0) + 1
+    links = sorted(w for w in count if count[w] > 1)
+    rand = random.Random(args.seed)
+    devnull = open(os.devnull, 'w')
+
+    try:
+        start(['./wires', '--quiet', str(topology.nwires(bridge_list, host_list))], devnull)
+        wait_for_wires()
+
+        t0 = time.time()
+        bridges = [BridgeProc(mac, ports) for mac, ports in bridge_list]
+        extra = ['--ring'] if args.ring else []
+        for mac, wire, remote in host_list:
+            start(['./host'] + extra + [mac, str(wire), remote], devnull)
+
+        print '%d bridges, %d hosts, %d links between bridges' % \
+            (len(bridges), len(host_list), len(links))
+        initial = converge(bridges, set(), t0)
+        print 'initial  %s' % ('timed out' if initial is None else '%.2fs' % initial)
+        sys.stdout.flush()
+
+        fail, fix = [], []
+        for n in range(args.trials if links else 0):
+            w = rand.choice(links)
+            send_ctl('FAIL %d' % w)
+            fail.append(converge(bridges, set([w]), time.time()))
+            send_ctl('FIX %d' % w)
+            fix.append(converge(bridges, set(), time.time()))
+            print 'trial %d: wire %d  fail %s  fix %s' % ((n + 1, w) +
+                tuple('timed out' if x is None else '%.2fs' % x for x in (fail[-1], fix[-1])))
+            sys.stdout.flush()
+    except KeyboardInterrupt:   #so ^C works
+        sys.exit(1)
+    finally:
+        stop_all()
+
+    results = {'topology': args.topology, 'bridges': len(bridges),
+               'hosts': len(host_list), 'settle': args.settle,
+               'initial': initial, 'fail': summary(fail), 'fix': summary(fix)}
+    print
+    print_summary('fail', results['fail'])
+    print_summary('fix', results['fix'])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,60 @@
+#
+# macaddr.py - MAC addresses as 48-bit integers
+#
+# The bridge, host and test scripts all handle MAC addresses. Internally they
+# are plain ints: they compare, sort (in the same order as the 6 bytes) and hash
+# as fast as anything can, and 'next address' is just + 1. from_bytes() and
+# to_bytes() convert to and from the 6 bytes in a frame, aton() and ntoa() to
+# and from 'xx:xx:xx:xx:xx:xx' text. ntoa() is for printing only; it keeps the
+# text of the NTOA_CACHE most recently printed addresses.
+#
+
+import struct
+import collections
+
+MAC = struct.Struct('!HI')
+MASK = 0xffffffffffff
+NTOA_CACHE = 4096
+
+# the MAC at 'offset' of 'buf' (a str, buffer, bytearray or memoryview)
+#
+def from_bytes(buf, offset=0):
+    hi, lo = MAC.unpack_from(buf, offset)
+    return hi << 32 | lo
+
+# the 6 bytes of MAC 'n'
+#
+def to_bytes(n):
+    return MAC.pack(n >> 32, n & 0xffffffff)
+
+# 'xx:xx:xx:xx:xx:xx' (or with '-') to a MAC; ValueError if it isn't one
+#
+def aton(a):
+    parts = a.replace('-', ':').split(':')
+    if len(parts) != 6:
+        raise ValueError('bad MAC address %s' % a)
+    n = 0
+    for x in parts:
+        b = int(x, 16)
+        if not 0 <= b <= 255:
+            raise ValueError('bad MAC address %s' % a)
+        n = n << 8 | b
+    return n
+
+_names = collections.OrderedDict()
+
+# MAC 'n' as 'xx:xx:xx:xx:xx:xx'
+#
+def ntoa(n):
+    name = _names.pop(n, None)
+    if name is None:
+        name = ':'.join(['%02x' % (n >> shift & 0xff) for shift in (40, 32, 24, 16, 8, 0)])
+        if len(_names) >= NTOA_CACHE:
+            _names.popitem(last=False)      # least recently printed
+    _names[n] = name
+    return name
+
+# true for group (multicast and broadcast) addresses
+#
+def is_multicast(n):
+    return n >> 40 & 1
@@ -0,0 +1,280 @@
+#
+# ring.py - shared-memory transport for "wires"
+#
+# Instead of writing every frame through a SEQPACKET socket, a host or bridge can
+# connect to '\0<name>.wire.<n>.ring'. It creates a file in /dev/shm holding two
+# single-producer/single-consumer rings, one for each direction, and sends its
+# path as the first message on the connection. The hub maps the same file and
+# answers 'OK', after which the file is unlinked and frames only go through
+# shared memory.
+#
+# The connection itself stays open as a doorbell, and to tell each side when the
+# other one goes away. A consumer that finds its ring empty sets the ring's
+# 'waiting' flag before going to sleep in select/epoll, and a producer only sends
+# a (one byte) doorbell message when it sees that flag set - so while traffic
+# flows, no system calls are made at all. To keep a consumer that is just a little
+# faster than its producer from asking for a doorbell on every frame, consumers
+# keep polling for RING_SPIN before they sleep (not on a single CPU, where that
+# would only take time away from the producer). Sleepers never wait longer than
+# RING_POLL, which covers a doorbell lost to the store/load race between the
+# flag and the ring indices.
+#
+# Each side only ever writes its own index, and a slot is always written before
+# the index that publishes it, which is enough on a machine with total store
+# order (x86).
+#
+
+import os
+import mmap
+import errno
+import ctypes
+import struct
+import select
+import time
+import socket
+import getpass
+import itertools
+import multiprocessing
+
+NSLOTS = 256                # frames per ring
+SLOT_SIZE = 1536            # 2-byte length + frame
+HDR_SIZE = 192              # head, tail and waiting, each on its own cache line
+RING_SIZE = HDR_SIZE + NSLOTS * SLOT_SIZE
+RING_POLL = 0.05            # longest a sleeper goes without looking at its ring
+RING_SPIN = 0.001 if multiprocessing.cpu_count() > 1 else 0
+                            # how long a consumer keeps polling before it sleeps
+
+LENGTH = struct.Struct('H')
+MAX_FRAME = 1500            # largest frame, as for the sockets (recv(1500))
+HEAD, TAIL, WAITING = 0, 64, 128
+
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp'
+
+# one direction of a connection. Only the producer calls put() and only the
+# consumer calls get(), each keeps its own index in a local copy. A frame
+# larger than MAX_FRAME, which socket readers would truncate, raises EMSGSIZE.
+#
+# The shared indices are accessed through ctypes rather than struct: pack_into
+# clears its target before writing it, and the other side could read that zero.
+#
+class Ring(object):
+    def __init__(self, mm, offset):
+        self.mm = mm
+        self.slots = offset + HDR_SIZE
+        self.shared_head = ctypes.c_uint64.from_buffer(mm, offset + HEAD)
+        self.shared_tail = ctypes.c_uint64.from_buffer(mm, offset + TAIL)
+        self.flag = ctypes.c_uint32.from_buffer(mm, offset + WAITING)
+        self.head = self.shared_head.value
+        self.tail = self.shared_tail.value
+
+    def put(self, dgram):
+        head = self.head
+        if head - self.shared_tail.value >= NSLOTS:
+            return False                            # full
+        if type(dgram) is not str:      # mmap slices only take str
+            dgram = dgram.tobytes() if type(dgram) is memoryview else str(dgram)
+        n = len(dgram)
+        if n > MAX_FRAME:
+            raise socket.error(errno.EMSGSIZE, os.strerror(errno.EMSGSIZE))
+        slot = self.slots + (head % NSLOTS) * SLOT_SIZE
+        LENGTH.pack_into(self.mm, slot, n)
+        self.mm[slot+2:slot+2+n] = dgram
+        self.head = head + 1
+        self.shared_head.value = self.head
+        return True
+
+    def _slot(self):
+        if self.tail == self.shared_head.value:
+            return None
+        slot = self.slots + (self.tail % NSLOTS) * SLOT_SIZE
+        return slot, LENGTH.unpack_from(self.mm, slot)[0]
+
+    def _advance(self):
+        self.tail += 1
+        self.shared_tail.value = self.tail
+
+    def get(self):
+        s = self._slot()
+        if s is None:
+            return None
+        slot, n = s
+        dgram = self.mm[slot+2:slot+2+n]
+        self._advance()
+        return dgram
+
+    def get_into(self, buf):
+        s = self._slot()
+        if s is None:
+            return None
+        slot, n = s
+        n = min(n, len(buf))            # truncated like recv_into() on a socket
+        buf[0:n] = self.mm[slot+2:slot+2+n]
+        self._advance()
+        return n
+
+    def empty(self):
+        return self.tail == self.shared_head.value
+
+    def waiting(self):
+        return self.flag.value
+
+    def set_waiting(self, flag):
+        self.flag.value = flag
+
+    # the ctypes views must be gone before the mapping is closed
+    def release(self):
+        del self.shared_head, self.shared_tail, self.flag
+
+# one end of a ring connection. It looks enough like a socket (fileno, send,
+# recv, recv_into, close) to be used in place of one; 'side' 0 is the host or
+# bridge end, 1 the hub end.
+#
+# Callers that multiplex several connections must not sleep while pending() is
+# true, since there is no doorbell for frames that arrived while they were
+# awake: call idle() before sleeping (it returns False if there is something
+# to read after all), and wake() when the socket becomes readable.
+#
+class RingEndpoint(object):
+    def __init__(self, sock, mm, side):
+        self.sock = sock
+        self.mm = mm
+        self.out_ring = Ring(mm, side * RING_SIZE)
+        self.in_ring = Ring(mm, (1 - side) * RING_SIZE)
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def getsockname(self):
+        return self.sock.getsockname()
+
+    def getpeername(self):
+        return self.sock.getpeername()
+
+    # queue a frame for the other side. Like a non-blocking socket it does
+    # not wait for room: it returns 0 if the ring is full.
+    def send(self, dgram):
+        if not self.out_ring.put(dgram):
+            return 0
+        if self.out_ring.waiting():
+            try:
+                self.sock.send('\0', socket.MSG_DONTWAIT)
+            except socket.error:
+                pass                # doorbell already pending, or peer gone
+        return len(dgram)
+
+    def get(self):
+        return self.in_ring.get()
+
+    def pending(self):
+        return not self.in_ring.empty()
+
+    def idle(self):
+        self.in_ring.set_waiting(1)
+        if self.in_ring.empty():
+            return True
+        self.in_ring.set_waiting(0)
+        return False
+
+    # back from sleep without a doorbell: stop asking for them
+    def busy(self):
+        self.in_ring.set_waiting(0)
+
+    # the socket is readable: consume doorbells. Returns False once the
+    # other side has closed the connection.
+    def wake(self):
+        self.in_ring.set_waiting(0)
+        while not self.closed:
+            try:
+                if not self.sock.recv(16, socket.MSG_DONTWAIT):
+                    self.closed = True
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.closed = True
+                break
+        return not self.closed
+
+    # block until a frame arrives; '' when the connection is lost
+    def recv(self, n=1500):
+        while True:
+            dgram = self.in_ring.get()
+            if dgram is not None:
+                return dgram[:n]
+            if self.closed:
+                return ''
+            self.wait()
+
+    # like recv(), into 'buf'. Returns 0 when the connection is lost, and
+    # does not block if the other side is gone or 'buf' can be filled now.
+    def recv_into(self, buf):
+        while True:
+            n = self.in_ring.get_into(buf)
+            if n is not None:
+                return n
+            if self.closed:
+                return 0
+            self.wait()
+
+    def wait(self, timeout=RING_POLL):
+        deadline = time.time() + RING_SPIN
+        while time.time() < deadline:
+            if self.pending() or self.closed:
+                return
+        if self.idle():
+            try:
+                select.select([self.sock], [], [], timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+        self.wake()
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.out_ring.release()
+        self.in_ring.release()
+        self.mm.close()
+
+counter = itertools.count()
+
+# connect to the ring address of wire 'wirenum', binding to 'local' first if
+# given (it is shown by 'wires --verbose', as with socket connections).
+# Returns a RingEndpoint, or None on a connection error.
+#
+def connect(wirenum, local=None):
+    path = os.path.join(SHM_DIR, '%s.ring.%d.%d.%d' % (getpass.getuser(), wirenum,
+                                                        os.getpid(), next(counter)))
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0600)
+    try:
+        os.ftruncate(fd, 2 * RING_SIZE)
+        mm = mmap.mmap(fd, 2 * RING_SIZE)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        if local is not None:
+            s.bind(local)
+        if s.connect_ex('\0%s.wire.%d.ring' % (getpass.getuser(), wirenum)):
+            s.close()
+            mm.close()
+            return None
+        s.send(path)
+        if s.recv(16) != 'OK':
+            s.close()
+            mm.close()
+            return None
+    finally:
+        os.close(fd)
+        os.unlink(path)
+    return RingEndpoint(s, mm, 0)
+
+# hub side: map the rings named by 'path', which the other end of 's' sent
+# as its first message.
+#
+def attach(s, path):
+    if not path.startswith(SHM_DIR + '/') or '/' in path[len(SHM_DIR)+1:]:
+        raise ValueError('bad ring path %r' % path)
+    fd = os.open(path, os.O_RDWR)
+    try:
+        mm = mmap.mmap(fd, 2 * RING_SIZE)
+    finally:
+        os.close(fd)
+    s.send('OK')
+    return RingEndpoint(s, mm, 1)
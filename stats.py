@@ -0,0 +1,12 @@
+#
+# stats.py - the statistics bench-stp.py and bench-fwd.py report
+#
+
+import math
+
+# nearest-rank percentile of a sorted list: the value at rank ceil(p% of n).
+# p% of n is rounded first, so that 99.9% of 1000 is 999 and not 999.0000001
+#
+def percentile(values, p):
+    k = max(int(math.ceil(round(p * len(values) / 100.0, 6))) - 1, 0)
+    return values[k]
@@ -8,6 +8,7 @@ import select, time, string
 import struct, socket
 import signal, sys, getpass
 import argparse
+import ring
 
 #------------------------------------
 
@@ -17,10 +18,17 @@ import argparse
 
 listeners = []
 
-# connect to a wire and return a socket
+# connect to a wire and return a socket (a ring endpoint with '--ring')
 def connect(wirenum, local):
+    name = '\0%s.host-%s)' % (getpass.getuser(), local)
+    if args.ring:
+        s = ring.connect(wirenum, name)
+        if s is None:
+            print 'connection error'
+            sys.exit(1)
+        return s
     s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
-    s.bind('\0%s.host-%s)' % (getpass.getuser(), local))
+    s.bind(name)
     if s.connect_ex('\0%s.wire.%d' % (getpass.getuser(), wirenum)):
         print 'connection error'
         sys.exit(1)
@@ -49,21 +57,38 @@ def find_listener(sock):
 def hexdump(pkt):
     return ' '.join(['%02x' % ord(x) for x in pkt[:]])
 
-# listen on all sockets
+def deliver(l, dgram):
+    if not dgram:
+        l.error = 'Receive failed'
+        l.done()
+    elif l.responder:
+        l.responder(l, dgram)
+    else:
+        l.received.append(dgram)
+
+# listen on all sockets. Ring endpoints are drained before going to sleep, and
+# their sockets only wake us up
 def _listen_thread():
     while True:
-        rfds,ign1,ign2 = select.select([x.sock for x in listeners], [], [])
+        timeout = None
+        for l in listeners:
+            if isinstance(l.sock, ring.RingEndpoint):
+                timeout = ring.RING_POLL if l.sock.idle() else 0
+                if timeout == 0:
+                    break
+        rfds,ign1,ign2 = select.select([x.sock for x in listeners], [], [], timeout)
         for s in rfds:
-            dgram = s.recv(1500)
             l = find_listener(s)
-            if not dgram:
-                l.error = 'Receive failed'
-                l.done()
+            if isinstance(s, ring.RingEndpoint):
+                if not s.wake():
+                    deliver(l, '')
             else:
-                if l.responder:
-                    l.responder(l, dgram)
-                else:
-                    l.received.append(dgram)
+                deliver(l, s.recv(1500))
+        for l in listeners[:]:
+            if isinstance(l.sock, ring.RingEndpoint):
+                l.sock.busy()
+                while l in listeners and l.sock.pending():
+                    deliver(l, l.sock.get())
 
 def listen_thread():
     try:
@@ -128,6 +153,7 @@ parser = argparse.ArgumentParser(description='Test-lb - test learning bridge fun
 parser.add_argument('--verbose', action='store_true', help='verbose printing')
 parser.add_argument('--nowait', action='store_true', help='don\'t wait 30s for listening/learning states')
 parser.add_argument('--tests', metavar='n[,n,...]', nargs=1, help='tests to run')
+parser.add_argument('--ring', action='store_true', help='connect through shared-memory rings')
 parser.add_argument('extra', nargs='*', help='[-- arg [arg...]] argument to bridge executable')
 args = parser.parse_args()
 
@@ -135,7 +161,8 @@ b_id = '01:01:01:01:01:01'
 w_args = ('./wires', '--verbose') if args.verbose else ('./wires', '--quiet') 
 w = subprocess.Popen(w_args, stdout=sys.stdout)
 time.sleep(1.0)
-s1 = subprocess.Popen(['./bridge'] + args.extra + [b_id, '0', '1', '2'], 
+b_args = ['--ring'] if args.ring else []
+s1 = subprocess.Popen(['./bridge'] + b_args + args.extra + [b_id, '0', '1', '2'], 
                       stdout=sys.stdout, stderr=sys.stdout)
 time.sleep(1.0)
 if not args.nowait:
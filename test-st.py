@@ -8,6 +8,7 @@ import select, time, string
 import struct, socket
 import signal, sys, getpass
 import argparse
+import macaddr
 
 #------------------------------------
 
@@ -219,7 +220,7 @@ def print_error(pkt, p):
             msg = ' ' * len(msg)
 
 def ether_ntoa(n):
-    return ':'.join(['%02x' % ord(x) for x in n[:]])
+    return macaddr.ntoa(macaddr.from_bytes(n))
 
 #------------------------------------
 # test 2 - send out appropriate initial BPDUs
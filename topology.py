@@ -0,0 +1,50 @@
+#
+# topology.py - the topology files read by 'fabric' and bench-stp.py
+#
+# A topology file has a line for every bridge and host:
+#
+#     bridge 01:00:00:00:00:01  0 1 2             # bridge ID, wires of its ports
+#     01:00:00:00:00:02  2 3                      # ('bridge' may be left out)
+#     host 00:00:00:00:00:0a  0  00:00:00:00:00:0b  # MAC, wire, MAC it sends to
+#
+# Blank lines and '#' comments are ignored. MAC addresses are returned in the
+# canonical lower-case form, so that they sort like the addresses themselves.
+#
+
+import macaddr
+
+# 'xx:xx:xx:xx:xx:xx' (or with '-') in canonical form; ValueError if it isn't one
+#
+def mac(a):
+    return macaddr.ntoa(macaddr.aton(a))
+
+# read a topology from file 'f'. Returns (bridges, hosts): a list of
+# (id, [wire, ...]) and a list of (mac, wire, remote mac). Errors are reported
+# as ValueError('line n: ...').
+#
+def read(f):
+    bridges, hosts = [], []
+    for n, line in enumerate(f):
+        words = line.split('#')[0].split()
+        if not words:
+            continue
+        try:
+            if words[0] == 'host':
+                if len(words) != 4:
+                    raise ValueError('usage: host <mac> <wire> <remote mac>')
+                hosts.append((mac(words[1]), int(words[2]), mac(words[3])))
+            else:
+                if words[0] == 'bridge':
+                    words = words[1:]
+                if len(words) < 2:
+                    raise ValueError('bridge without ports')
+                bridges.append((mac(words[0]), [int(w) for w in words[1:]]))
+        except ValueError as e:
+            raise ValueError('line %d: %s' % (n + 1, e))
+    return bridges, hosts
+
+# number of wires used, i.e. the highest wire number + 1
+#
+def nwires(bridges, hosts):
+    wires = [w for b, ports in bridges for w in ports] + [w for h, w, r in hosts]
+    return max(wires) + 1 if wires else 0